@@ -3,61 +3,122 @@
 # author: @ulyantsev
 import datetime
 
-import ijson
+# explicitly selecting the fastest available ijson backend,
+# plain 'import ijson' may fall back to the pure python one
+try:
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    try:
+        import ijson.backends.yajl2_cffi as ijson
+    except ImportError:
+        import ijson
+# orjson parses a whole json file several times faster than ijson, so it is used for not too big files
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import os
 import sys
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from plotly.subplots import make_subplots
 
 
 CHAT_TYPES = ['private_group', 'personal_chat']
 
-MESSAGE_RECORDS = {'id': 'int',
-                   'date': 'datetime64[ns]',
-                   'type': 'category',
-                   'from_id': 'category',
-                   'text': 'string',
-                   'forwarded_from': 'category',
-                   'media_type': 'category',
-                   'duration_seconds': 'Int64',
-                   'file': 'category'}
+# dictionary encoded strings, converted to pandas categorical columns
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
 
-CHAT_RECORDS = {'id': 'category',
-                'name': 'category',
-                'type': 'category'}
+MESSAGE_RECORDS = {'id': pa.int32(),
+                   'date': pa.timestamp('ns'),
+                   'type': CATEGORY,
+                   'from_id': pa.uint64(),
+                   'text': pa.string(),
+                   'forwarded_from': CATEGORY,
+                   'media_type': CATEGORY,
+                   'duration_seconds': pa.int32(),
+                   'file': CATEGORY}
+
+CHAT_RECORDS = {'id': pa.dictionary(pa.int32(), pa.int64()),
+                'name': CATEGORY,
+                'type': CATEGORY}
 
 CHAT_RECORDS_PREFIX = 'chat_'
 
+# arrow types converted to pandas extension types instead of object columns,
+# arrow backed strings are taken by pandas as is, without creating python string objects.
+# Dictionary columns are left to become pandas categorical ones: their codes are downcast
+# to the smallest int type, while pd.ArrowDtype keeps int32 dictionary indices
+PANDAS_TYPES = {pa.string(): pd.StringDtype('pyarrow'),
+                pa.large_string(): pd.StringDtype('pyarrow')}
+
+# suffix added to json file path for caching the messages dataframe
+PARQUET_CACHE_SUFFIX = '.parquet'
+
+# parquet metadata key of the settings fingerprint, the cache is rebuilt when it doesn't match
+PARQUET_CACHE_METADATA_KEY = b'tg_takeout_parser_fingerprint'
+
+# files smaller than this size (in bytes) are parsed with orjson at once, if it is installed
+INMEMORY_JSON_MAX_SIZE = 512 * 2 ** 20
+
+# number of chats converted to a typed arrow table at once
+CHATS_CHUNK_SIZE = 50
+
+# number of threads converting chunks of chats to arrow tables
+CHATS_CONVERT_WORKERS = min(4, os.cpu_count() or 1)
+
+# prefix of users ids in 'from_id' fields, like 'user123456'
+USER_ID_PREFIX = 'user'
+
+# placeholder for links in normalized message text
+LINK_PLACEHOLDER = '<<link>>'
+
 STAT_FUNCTIONS = {f'{CHAT_RECORDS_PREFIX}id': 'nunique',
                   'id': 'count',
-                  'text': lambda x: np.sum(x.str.len()),
+                  'text_len': 'sum',
                   'duration_seconds': 'sum'}
 
 STAT_COLUMNS_NAMES = ['chats', 'msg', 'chr', 'media_sec']
 
+# pandas period frequencies which could be computed by numpy datetime64 truncation:
+# frequency -> (datetime64 unit, number of units in a period)
+NUMPY_PERIOD_UNITS = {'Y': ('Y', 1),
+                      'Q': ('M', 3),
+                      'M': ('M', 1),
+                      'D': ('D', 1),
+                      'h': ('h', 1),
+                      'min': ('m', 1),
+                      's': ('s', 1)}
 
-def load_needed_chats_data(json_path: str) -> list:
+
+def load_needed_chats_data(json_path: str) -> Iterator[dict]:
     """
     Iteratively loads chats data from telegram takeout json file.
-    This could be replaced with json.load(), if you don't want to use ijson.
+    Files smaller than INMEMORY_JSON_MAX_SIZE are parsed at once with orjson (if installed),
+    bigger ones are streamed with ijson.
 
     :param json_path: path to telegram takeout json file
-    :return: list of dictionaries with chats data
-    """
-    with open(json_path, encoding='utf-8') as result_file:
-        objects = ijson.items(result_file, 'chats.list.item')
-        chats = (o for o in objects if o['type'] in CHAT_TYPES)
-        res = []
-        for chat in chats:
-            c = {k: v for k, v in chat.items() if k in CHAT_RECORDS}
-            c['messages'] = [{k: v for k, v in m.items() if k in MESSAGE_RECORDS} for m in chat['messages']]
-            res.append(c)
-        return res
+    :return: generator of dictionaries with chats data
+    """
+    with open(json_path, 'rb') as result_file:
+        if orjson is not None and os.fstat(result_file.fileno()).st_size < INMEMORY_JSON_MAX_SIZE:
+            objects = orjson.loads(result_file.read())['chats']['list']
+        else:
+            objects = ijson.items(result_file, 'chats.list.item', use_float=True)
+        # chats are not copied with only the needed fields, gen_messages_table() reads
+        # the selected fields itself, so a copy of every message dict would be dropped right away
+        yield from (o for o in objects if o['type'] in CHAT_TYPES)
 
 def load_my_id(json_path: str) -> int:
-    with open(json_path, encoding='utf-8') as result_file:
-        objects = ijson.items(result_file, 'personal_information')
+    with open(json_path, 'rb') as result_file:
+        objects = ijson.items(result_file, 'personal_information', use_float=True)
         return next(objects)['user_id']
 
 
@@ -73,20 +134,134 @@ def normalize_text_value(value: str | list,
     :return: a normalized string
     """
 
-    def elem_f(e): return f"<<link>>" if (replace_links and e['type'] == 'link') else e['text']
+    def elem_f(e): return LINK_PLACEHOLDER if (replace_links and e['type'] == 'link') else e['text']
 
     if isinstance(value, list):
-        return ' '.join([t if isinstance(t, str) else elem_f(t) for t in value])
+        return ' '.join(t if isinstance(t, str) else elem_f(t) for t in value)
     return value
 
 
-def gen_messages_dataframe(chats_list,
+def get_nested_value(record: dict, path: tuple[str, ...]):
+    """
+    Get value of a nested field, like json_normalize() flattens them to dotted column names.
+
+    :param record: a dictionary with nested dictionaries
+    :param path: keys of the nested dictionaries, like ('poll', 'question')
+    :return: the field value or None, if any of the keys is missing
+    """
+    value = record
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def gen_messages_table(chats: list[dict],
+                       schema: pa.Schema) -> pa.Table:
+    """
+    Generate typed arrow table from a chunk of chats.
+
+    :param chats: list of chats
+    :param schema: arrow schema of the resulting table
+    :return: table with messages
+    """
+    # building only selected columns directly, one list per column,
+    # instead of normalizing every message field and dropping the most of them
+    columns = {k: [] for k in MESSAGE_RECORDS}
+    chats_records = {k: [] for k in CHAT_RECORDS}
+    messages_counts = []
+    copied_records = [k for k in MESSAGE_RECORDS if k != 'from_id' and '.' not in k]
+    # dotted records (like 'poll.question') are nested fields, their paths are split once for all messages
+    nested_records = {k: tuple(k.split('.')) for k in MESSAGE_RECORDS if '.' in k}
+    prefix_len = len(USER_ID_PREFIX)
+    for chat in chats:
+        # service messages and other non-message records are removed before building any column
+        messages = [m for m in chat['messages'] if m.get('type') == 'message']
+        # chats without messages are skipped, so they don't become unused categories
+        if not messages:
+            continue
+        for k in CHAT_RECORDS:
+            chats_records[k].append(chat.get(k))
+        messages_counts.append(len(messages))
+        for k in copied_records:
+            columns[k].extend([m.get(k) for m in messages])
+        for k, path in nested_records.items():
+            columns[k].extend([get_nested_value(m, path) for m in messages])
+
+        # removing 'user' prefix from 'from_id' fields and parsing ids right on building,
+        # so no column of id strings is kept, ids of other senders (like channels) are set to 0
+        columns['from_id'].extend([int(v[prefix_len:]) if (v := m.get('from_id')) and v.startswith(USER_ID_PREFIX)
+                                   else 0 for m in messages])
+
+    # chat records are stored once per chat and taken by the chat index of every message,
+    # taking from a dictionary array copies only its int32 indices, not the values
+    chat_indices = pa.array(np.repeat(np.arange(len(messages_counts), dtype=np.int32), messages_counts))
+    for k, values in chats_records.items():
+        name = f'{CHAT_RECORDS_PREFIX}{k}'
+        columns[name] = pa.array(values, schema.field(name).type).take(chat_indices)
+
+    # the majority of texts are already strings, so normalizing only the rest
+    # in a plain list comprehension instead of calling a function for each row
+    columns['text'] = [t if isinstance(t, str) else normalize_text_value(t) for t in columns['text']]
+
+    # dates are ISO formatted strings, arrow parses them only by casting
+    columns['date'] = pa.array(columns['date'], pa.string()).cast(schema.field('date').type)
+
+    # category columns are dictionary encoded right on building,
+    # so they are not rehashed by pandas astype('category')
+    table = pa.Table.from_pydict(columns, schema=schema)
+
+    # duration is missing for non-media messages, zero is the same for the stats sums
+    # and keeps the column a plain int32 instead of a nullable one
+    table = table.set_column(table.schema.get_field_index('duration_seconds'), 'duration_seconds',
+                             pc.fill_null(table['duration_seconds'], 0))
+
+    # precomputing text lengths, so stats are aggregated with built-in functions only
+    return table.append_column('text_len', pc.fill_null(pc.utf8_length(table['text']), 0))
+
+
+def gen_messages_schema() -> pa.Schema:
+    """
+    Generate arrow schema of the messages from CHAT_RECORDS and MESSAGE_RECORDS.
+
+    :return: schema with prefixed chat records followed by message records
+    """
+    chat_columns_types = {f'{CHAT_RECORDS_PREFIX}{k}': v for k, v in CHAT_RECORDS.items()}
+    return pa.schema({**chat_columns_types, **MESSAGE_RECORDS})
+
+
+def gen_cache_fingerprint(schema: pa.Schema) -> bytes:
+    """
+    Generate fingerprint of the settings the messages dataframe depends on, stored in the parquet cache metadata.
+
+    :param schema: arrow schema of the messages, like gen_messages_schema() output
+    :return: fingerprint bytes
+    """
+    return f'{schema}\nchat_types: {CHAT_TYPES}'.encode()
+
+
+def print_dataframe_stats(df: pd.DataFrame) -> None:
+    """
+    Print to console dataframe head, info and memory usage.
+
+    :param df: dataframe with messages
+    """
+    print(df.head(15).to_string())
+    print(df.info(verbose=False))
+    print(df.memory_usage(deep=True))
+
+
+def gen_messages_dataframe(chats_list: Iterable[dict],
                            chat_types=None,
                            print_stats=False) -> pd.DataFrame:
     """
     Generate dataframe from telegram takeout json data->chats->list.
+    Chats are converted by chunks of CHATS_CHUNK_SIZE in a pool of CHATS_CONVERT_WORKERS threads,
+    while the next chats are being loaded. At most one chunk per worker is waiting for conversion,
+    so an iterator of chats (like load_needed_chats_data() output) is never loaded in memory as a whole.
 
-    :param chats_list: list of chats
+    :param chats_list: iterable of chats
     :param print_stats: print to console dataframe info and memory usage
     :param chat_types: list of chat types to include in the resulting dataframe
     {'private_group', 'bot_chat', 'public_supergroup', 'saved_messages',
@@ -97,67 +272,230 @@ def gen_messages_dataframe(chats_list,
     if chat_types is None:
         chat_types = CHAT_TYPES
 
-    df = pd.json_normalize(chats_list,
-                           record_path="messages",
-                           meta=["name", "id", "type"],
-                           meta_prefix=CHAT_RECORDS_PREFIX,
-                           errors="ignore")
+    schema = gen_messages_schema()
+
+    tables = []
+    with ThreadPoolExecutor(max_workers=CHATS_CONVERT_WORKERS) as executor:
+        # futures are kept in the chunks order, so the resulting rows order doesn't depend on threads
+        futures = deque()
+        chunk = []
+        for chat in chats_list:
+            if chat.get('type') not in chat_types:
+                continue
+            chunk.append(chat)
+            if len(chunk) == CHATS_CHUNK_SIZE:
+                futures.append(executor.submit(gen_messages_table, chunk, schema))
+                chunk = []
+                if len(futures) > CHATS_CONVERT_WORKERS:
+                    tables.append(futures.popleft().result())
+        if chunk or not (futures or tables):
+            futures.append(executor.submit(gen_messages_table, chunk, schema))
+        tables.extend(f.result() for f in futures)
+
+    # arrow unifies the chunks dictionaries, so pandas gets ready categorical columns
+    table = pa.concat_tables(tables)
+    del tables
+    df = table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=PANDAS_TYPES.get)
+    del table
 
-    # leaving only selected columns
-    chat_columns_types = {f'{CHAT_RECORDS_PREFIX}{k}': v for k, v in CHAT_RECORDS.items()}
-    columns_types = {**chat_columns_types, **MESSAGE_RECORDS}
-    df = df.reindex(list(columns_types.keys()), axis='columns')
+    if print_stats:
+        print_dataframe_stats(df)
 
-    df = df[df[f'{CHAT_RECORDS_PREFIX}type'].isin(chat_types)]
+    return df
 
-    # removing service messages and other non-message records
-    df = df[df['type'] == 'message']
 
-    df['text'] = df['text'].apply(normalize_text_value)
+def read_messages_cache(cache_path: str,
+                        schema: pa.Schema,
+                        fingerprint: bytes) -> pd.DataFrame | None:
+    """
+    Read dataframe with messages from the parquet cache.
 
-    # removing 'user' prefix from 'from_id' fields
-    df['from_id'] = df['from_id'].str.replace('user', '')
-    df['from_id'] = df['from_id'].astype('uint64')
+    :param cache_path: path to the parquet cache file
+    :param schema: arrow schema of the messages, like gen_messages_schema() output
+    :param fingerprint: cache fingerprint, like gen_cache_fingerprint() output
+    :return: dataframe with messages or None, if the cache is unreadable or was saved with other settings
+    """
+    try:
+        cached_schema = pq.read_schema(cache_path)
+    except (OSError, pa.ArrowException):
+        return None
+
+    # the cache is rebuilt after changing the records or chat types constants
+    metadata = cached_schema.metadata or {}
+    if metadata.get(PARQUET_CACHE_METADATA_KEY) != fingerprint or \
+            cached_schema.names != [*schema.names, 'text_len']:
+        return None
+
+    df = pq.read_table(cache_path).to_pandas(split_blocks=True, self_destruct=True, types_mapper=PANDAS_TYPES.get)
+
+    # parquet keeps dictionary encoding for string columns only, so int ones (like chat ids) are converted back
+    for field in schema:
+        if pa.types.is_dictionary(field.type) and not isinstance(df[field.name].dtype, pd.CategoricalDtype):
+            df[field.name] = df[field.name].astype('category')
+    return df
 
-    # decreasing memory usage by converting to categorical when possible
-    # df.convert_dtypes() is not working for categorical automatically
-    df = df.astype(columns_types)
 
-    if print_stats:
-        print(df.head(15).to_string())
-        print(df.info(verbose=False))
-        print(df.memory_usage(deep=True))
+def write_messages_cache(df: pd.DataFrame,
+                         cache_path: str,
+                         fingerprint: bytes) -> None:
+    """
+    Write dataframe with messages to the parquet cache. Write errors are only reported,
+    so a read-only directory doesn't make the already generated dataframe lost.
+
+    :param df: dataframe with messages
+    :param cache_path: path to the parquet cache file
+    :param fingerprint: cache fingerprint, like gen_cache_fingerprint() output
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, PARQUET_CACHE_METADATA_KEY: fingerprint})
+    try:
+        pq.write_table(table, cache_path, compression='zstd')
+    except OSError as e:
+        print(f"Can't write messages cache {cache_path}: {e}", file=sys.stderr)
+
+
+def load_messages_dataframe(json_path: str,
+                            print_stats=False) -> pd.DataFrame:
+    """
+    Loads dataframe with messages from the parquet cache next to telegram takeout json file.
+    If the cache is missing, older than the json file or saved with other MESSAGE_RECORDS,
+    CHAT_RECORDS or CHAT_TYPES, the dataframe is generated
+    with gen_messages_dataframe() and saved to the cache, so JSON is parsed only on the first run.
+
+    :param json_path: path to telegram takeout json file
+    :param print_stats: print to console dataframe info and memory usage
+    :return: dataframe with messages
+    """
+    schema = gen_messages_schema()
+    fingerprint = gen_cache_fingerprint(schema)
+    cache_path = json_path + PARQUET_CACHE_SUFFIX
+
+    df = None
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(json_path):
+        df = read_messages_cache(cache_path, schema, fingerprint)
+
+    if df is None:
+        df = gen_messages_dataframe(load_needed_chats_data(json_path), print_stats=print_stats)
+        write_messages_cache(df, cache_path, fingerprint)
+    elif print_stats:
+        print_dataframe_stats(df)
 
     return df
 
 
+def gen_period_keys(dates: pd.Series, freq="M"):
+    """
+    Generate grouping keys of the periods for the dates.
+    Truncating datetime64 values is much cheaper than building Period objects,
+    so it is used for the frequencies from NUMPY_PERIOD_UNITS, other ones are converted with dt.to_period().
+    :param dates: datetime64 series
+    :param freq: pandas period frequency
+    :return: array of keys aligned with dates
+    """
+    if freq not in NUMPY_PERIOD_UNITS:
+        return dates.dt.to_period(freq).array
+
+    unit, step = NUMPY_PERIOD_UNITS[freq]
+    keys = dates.to_numpy().astype(f'datetime64[{unit}]')
+    if step > 1:
+        # datetime64 values are int64 counts of units since 1970-01-01,
+        # so flooring them to a multiple of step gives the period start.
+        # NaT is int64 min and would overflow, it is kept as is to be dropped by groupby
+        floored = (keys.view('i8') // step * step).view(keys.dtype)
+        keys = np.where(np.isnat(keys), keys, floored)
+    return keys
+
+
 def gen_stats_dataframe(df: pd.DataFrame,
                         exclude_forwarded=False,
-                        freq="M") -> pd.DataFrame:
+                        freq="M",
+                        by=None,
+                        keys=None) -> pd.DataFrame:
     """
     Generate dataframe with stats aggregated from dataframe with messages
+    :param df: dataframe with messages
+    :param exclude_forwarded: exclude forwarded messages from the stats
+    :param freq: pandas period frequency to aggregate the stats by
+    :param by: list of additional grouping keys (arrays aligned with df), added as inner index levels
+    :param keys: period keys precomputed with gen_period_keys() for the same freq (array aligned with df)
+    :return: dataframe with stats
     """
     stat_df = df
+    by = [] if by is None else list(by)
+    if keys is None:
+        keys = gen_period_keys(stat_df['date'], freq)
     if exclude_forwarded:
-        stat_df = stat_df[stat_df['forwarded_from'].isna()]
-
-    stat_df = stat_df.groupby(stat_df.date.dt.to_period(freq)).agg(STAT_FUNCTIONS)
+        mask = stat_df['forwarded_from'].isna().to_numpy()
+        stat_df = stat_df[mask]
+        keys = keys[mask]
+        by = [b[mask] for b in by]
+
+    stat_df = stat_df.groupby([keys, *by]).agg(STAT_FUNCTIONS)
+
+    # truncated datetime64 keys are converted to periods only after the aggregation
+    index = stat_df.index
+    if isinstance(index, pd.MultiIndex) and isinstance(index.levels[0], pd.DatetimeIndex):
+        stat_df.index = index.set_levels(index.levels[0].to_period(freq), level=0)
+    elif isinstance(index, pd.DatetimeIndex):
+        stat_df.index = index.to_period(freq)
+    stat_df.index.names = ['date', *stat_df.index.names[1:]]
     stat_df.columns = STAT_COLUMNS_NAMES
     return stat_df
 
 
-def gen_sent_received_dataframe(msg_df: pd.DataFrame, my_id: int) -> pd.DataFrame:
+def gen_sent_received_dataframe(msg_df: pd.DataFrame, my_id: int, keys=None) -> pd.DataFrame:
     """
     Generate dataframe with separated stats for sent and received messages.
     :param msg_df: dataframe with messages
     :param my_id: owner id number
+    :param keys: monthly period keys precomputed with gen_period_keys() (array aligned with msg_df)
     :return: dataframe with stats
     """
-    sent_df = gen_stats_dataframe(msg_df[msg_df['from_id'] == my_id], exclude_forwarded=True)
-    received_df = gen_stats_dataframe(msg_df[msg_df['from_id'] != my_id])
+    # aggregating sent and received messages in a single groupby by the sender group:
+    # 1 - sent, 0 - received, -1 - forwarded by the owner, excluded from the sent stats
+    is_sent = msg_df['from_id'].to_numpy() == my_id
+    is_forwarded = msg_df['forwarded_from'].notna().to_numpy()
+    sender = np.where(is_sent, np.where(is_forwarded, -1, 1), 0).astype('int8')
+
+    stat_df = gen_stats_dataframe(msg_df, by=[sender], keys=keys)
+    sender_level = stat_df.index.get_level_values(1)
+    sent_df = stat_df[sender_level == 1].droplevel(1)
+    received_df = stat_df[sender_level == 0].droplevel(1)
     return sent_df.merge(received_df, on='date', suffixes=('_sent', '_received'))
 
 
+def gen_sent_received_plotly_fig(merged_df: pd.DataFrame,
+                                 start_date=pd.Timestamp.min,
+                                 end_date=pd.Timestamp.max,
+                                 show_received=False) -> go.Figure:
+    """
+    Generate plotly figure from dataframe with sent and received messages stats.
+    Only the stats dataframe rows are filtered here, so for plotting several date ranges
+    aggregate the messages once with gen_sent_received_dataframe() and call this function for each range.
+    :param merged_df: dataframe with stats from gen_sent_received_dataframe()
+    :param start_date: start date for plotting, the periods containing it are plotted whole
+    :param end_date: end date for plotting, the periods containing it are plotted whole
+    :param show_received: show received messages stats together with sent
+    """
+    merged_df = merged_df[(start_date <= merged_df.index.end_time) &
+                          (merged_df.index.start_time <= end_date)]
+    dates = merged_df.index.to_timestamp()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Bar(x=dates, y=merged_df['chr_sent'], name='chr_sent'), secondary_y=False)
+    if show_received:
+        fig.add_trace(go.Bar(x=dates, y=merged_df['chr_received'], name='chr_received'),
+                      secondary_y=False)
+
+    fig.add_trace(go.Scatter(x=dates, y=merged_df['msg_sent'], name='msg'), secondary_y=True)
+
+    fig.update_layout(title="TG sent messages stats",
+                      yaxis_title="characters sent",
+                      font={"size": 20, "color": "black"})
+    fig.update_yaxes(title_text="messages sent", secondary_y=True)
+    return fig
+
+
 def gen_stat_plotly_fig(msg_df: pd.DataFrame,
                         my_id: int,
                         start_date=pd.Timestamp.min,
@@ -173,31 +511,20 @@ def gen_stat_plotly_fig(msg_df: pd.DataFrame,
     """
     merged_df = gen_sent_received_dataframe(msg_df[(start_date <= msg_df['date']) &
                                                    (msg_df['date'] <= end_date)], my_id)
-
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(go.Bar(x=merged_df.index.to_timestamp(), y=merged_df['chr_sent'], name='chr_sent'), secondary_y=False)
-    if show_received:
-        fig.add_trace(go.Bar(x=merged_df.index.to_timestamp(), y=merged_df['chr_received'], name='chr_received'),
-                      secondary_y=False)
-
-    fig.add_trace(go.Scatter(x=merged_df.index.to_timestamp(), y=merged_df['msg_sent'], name='msg'), secondary_y=True)
-
-    fig.update_layout(title="TG sent messages stats",
-                      yaxis_title="characters sent",
-                      font={"size": 20, "color": "black"})
-    fig.update_yaxes(title_text="messages sent", secondary_y=True)
-    return fig
+    return gen_sent_received_plotly_fig(merged_df, show_received=show_received)
 
 
 def main(path: str) -> None:
-    jdata = load_needed_chats_data(path)
     my_id = load_my_id(path)
 
-    df = gen_messages_dataframe(jdata, print_stats=True)
-    gen_stat_plotly_fig(df, my_id,
-                        start_date=pd.Timestamp('2021-01-01'),
-                        end_date=pd.Timestamp('2023-12-31'),
-                        show_received=True).show()
+    df = load_messages_dataframe(path, print_stats=True)
+
+    # messages are aggregated once, the figures for different date ranges are built from the stats
+    merged_df = gen_sent_received_dataframe(df, my_id)
+    gen_sent_received_plotly_fig(merged_df,
+                                 start_date=pd.Timestamp('2021-01-01'),
+                                 end_date=pd.Timestamp('2023-12-31'),
+                                 show_received=True).show()
 
 
 if __name__ == '__main__':